@@ -93,18 +93,6 @@ DATABASES = {
             'isolation_level': psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ,
         },
     },
-    'serializable': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': config('DATABASE_NAME'),
-        'USER': config('DATABASE_USER'),
-        'PASSWORD': config('DATABASE_PASSWORD'),
-        'HOST': config('DATABASE_HOST'),
-        'PORT': config('DATABASE_PORT'),
-        'OPTIONS': {
-            'isolation_level': psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE,
-        },
-    }
-
 }
 
 # Password validation
@@ -152,6 +140,20 @@ STATICFILES_DIRS = (
 #  Add configuration for static files storage using whitenoise
 STATICFILES_STORAGE = 'whitenoise.django.GzipManifestStaticFilesStorage'
 
+# REST framework
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'filesystem.api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'filesystem.api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
 # CORS
 
 CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', cast=Csv())
@@ -164,4 +166,7 @@ CORS_ALLOW_METHODS = config('CORS_ALLOW_METHODS', cast=Csv())
 
 # REDIS
 
+REDIS_DB = config('REDIS_DB', default=0, cast=int)
+# Tests flush the cache, so they switch to their own Redis database instead of the one of the application
+REDIS_TEST_DB = config('REDIS_TEST_DB', default=1, cast=int)
 REDIS_DEFAULT_TTL = 60 * 30  # seconds = 30 minutes
\ No newline at end of file
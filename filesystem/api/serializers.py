@@ -1,11 +1,31 @@
-from typing import Union
+import copy
+from typing import Dict
 
 from rest_framework import serializers
 
-from filesystem.models import File, MAX_PATH_LENGTH, MAX_NAME_LENGTH, MAX_CONTENT_LENGTH
+from filesystem.models import MAX_PATH_LENGTH, MAX_NAME_LENGTH, MAX_CONTENT_LENGTH
 
+MAX_BATCH_SIZE = 100  # maximum number of commands within a batch
 
-class CdSerializer(serializers.Serializer):
+# Unbound fields of each serializer class, built once and shallow-copied into every new serializer instance
+_FIELDS_CACHE: Dict[type, Dict[str, serializers.Field]] = {}
+
+
+class CachedFieldsMixin:
+    """
+    DRF builds (deep copies) all fields of a serializer every time a new instance is bound, which is done on every
+    request. Fields of our serializers never change at runtime, so we build them only once per class and give each
+    instance shallow copies, which are cheap to create and safe to bind.
+    """
+
+    def get_fields(self) -> Dict[str, serializers.Field]:
+        fields = _FIELDS_CACHE.get(type(self))
+        if fields is None:
+            fields = _FIELDS_CACHE[type(self)] = super().get_fields()
+        return {name: copy.copy(field) for name, field in fields.items()}
+
+
+class CdSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for cd (change directory) command.
     Input: a raw folder path.
@@ -14,70 +34,43 @@ class CdSerializer(serializers.Serializer):
     folder_path = serializers.CharField(max_length=MAX_PATH_LENGTH, required=True)
 
 
-class CrSerializer(serializers.Serializer):
+class CrSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for cr (create) command.
     Input: a raw filepath, p flag (optional), new data (optional).
     """
     path = serializers.CharField(max_length=MAX_PATH_LENGTH, write_only=True)
     data = serializers.CharField(allow_null=True, write_only=True)
-    p_flag = serializers.BooleanField(allow_null=True, write_only=True)
-
-    def validate_p_flag(self, p_flag: Union[bool, None]) -> bool:
-        """
-        Set default p_flag = False.
-        """
-        if p_flag is None:
-            return False
-        return p_flag
+    # p_flag defaults to False when it is omitted. An explicit null is kept as None, which means the same thing.
+    p_flag = serializers.BooleanField(allow_null=True, default=False, write_only=True)
 
 
-class CatSerializer(serializers.Serializer):
+class CatSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for cat (show content) command.
     Input: a raw filepath.
     Output: content of the file at filepath.
     """
     file_path = serializers.CharField(max_length=MAX_PATH_LENGTH, write_only=True)
-    content = serializers.CharField(max_length=MAX_CONTENT_LENGTH, read_only=True)
-
-
-class FileSerializer(serializers.ModelSerializer):
-    """
-    Serialize meta-data of a file: name, created_at, updated_at, size.
-    """
-
-    class Meta:
-        model = File
-        fields = ['name', 'created_at', 'updated_at', 'size']
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        if instance.is_folder:
-            ret['name'] += '/'
-        if hasattr(instance, 'to_dot'):
-            ret['name'] = '.'
-        return ret
 
-
-class LsSerializer(serializers.Serializer):
+class LsSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for ls (list items) command.
     Input: a raw folder path.
-    Output: a list of meta-data information of direct children of the file (see FileSerializer).
+    Output: a list of meta-data information of direct children of the file (see api.utils.file_to_representation).
     """
     folder_path = serializers.CharField(max_length=MAX_PATH_LENGTH, write_only=True)
-    items = serializers.ListField(child=FileSerializer(), read_only=True)
 
 
-class FilePathSerializer(serializers.Serializer):
+class FilePathSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for filepath.
     """
     filepath = serializers.CharField(max_length=MAX_PATH_LENGTH)
 
 
-class FindSerializer(serializers.Serializer):
+class FindSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for find command.
     Input: a raw folder path and a name.
@@ -85,12 +78,9 @@ class FindSerializer(serializers.Serializer):
     """
     name = serializers.CharField(max_length=MAX_NAME_LENGTH, allow_blank=True, write_only=True)
     folder_path = serializers.CharField(max_length=MAX_PATH_LENGTH, write_only=True)
-    results = serializers.ListField(
-        child=serializers.CharField(max_length=MAX_PATH_LENGTH),
-        read_only=True)
 
 
-class UpSerializer(serializers.Serializer):
+class UpSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for up (update) command.
     Input: a raw filepath, a new name, new data (optional).
@@ -100,7 +90,7 @@ class UpSerializer(serializers.Serializer):
     data = serializers.CharField(max_length=MAX_CONTENT_LENGTH, allow_null=True, write_only=True)
 
 
-class MvSerializer(serializers.Serializer):
+class MvSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for mv (move) command.
     Input: a raw filepath, a raw folder path.
@@ -109,7 +99,7 @@ class MvSerializer(serializers.Serializer):
     folder_path = serializers.CharField(max_length=MAX_PATH_LENGTH, write_only=True)
 
 
-class RmSerializer(serializers.Serializer):
+class RmSerializer(CachedFieldsMixin, serializers.Serializer):
     """
     Serializer for rm (remove) command.
     Input: a list of raw filepaths.
@@ -117,3 +107,16 @@ class RmSerializer(serializers.Serializer):
     paths = serializers.ListField(
         child=serializers.CharField(max_length=MAX_PATH_LENGTH),
         write_only=True)
+
+
+class BatchSerializer(CachedFieldsMixin, serializers.Serializer):
+    """
+    Serializer for batch command.
+    Input: a list of commands, each one contains name of the command (cmd) and its arguments.
+    Output: a list of results, each one contains HTTP status code and data of the command's response.
+    """
+    ops = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        max_length=MAX_BATCH_SIZE,
+        write_only=True)
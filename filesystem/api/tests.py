@@ -1,5 +1,7 @@
 from collections import OrderedDict
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from rest_framework import status
 from rest_framework.reverse import reverse as api_reverse
 from rest_framework.test import APITestCase
@@ -12,15 +14,30 @@ from filesystem.models import FilePath
 class BaseAPITestCase(APITestCase):
     databases = '__all__'
 
+    @classmethod
+    def setUpClass(cls) -> None:
+        # Tests flush the cache, so they switch to their own database, whatever runs them
+        if settings.REDIS_TEST_DB == settings.REDIS_DB:
+            raise ImproperlyConfigured('REDIS_TEST_DB must differ from REDIS_DB, as tests flush it.')
+        cls._app_cache = cache.r
+        cache.r = cache.connect(settings.REDIS_TEST_DB)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        cache.r = cls._app_cache
+
     def setUp(self) -> None:
-        cache.r.flushall()
+        # Only the database of the cache is flushed, which is a separate one for tests (see setUpClass)
+        cache.r.flushdb(asynchronous=True)
         self._setUp()
 
     def _setUp(self) -> None:
         raise NotImplementedError
 
     def tearDown(self) -> None:
-        cache.r.flushall()
+        cache.r.flushdb(asynchronous=True)
 
 
 class CdAPITestCase(BaseAPITestCase):
@@ -297,3 +314,46 @@ class LsAPIViewTestCase(BaseAPITestCase):
             }
             res = self.client.post(self.URL, data, format='json')
             self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchAPIViewTestCase(BaseAPITestCase):
+    def _setUp(self) -> None:
+        self.URL = api_reverse('filesystem:batch')
+
+    def test_batch_then_200_OK(self):
+        data = {
+            'ops': [
+                {'cmd': 'cr', 'path': '/f1/f2/test', 'data': 'hello', 'p_flag': True},
+                {'cmd': 'cat', 'file_path': '/f1/f2/test'},
+                {'cmd': 'cat', 'file_path': '/f1/f2/abc'},
+                {'cmd': 'cd'},
+                {'cmd': 'abc'},
+                {'cmd': ['cd']},
+                {'cmd': 'find', 'folder_path': '/', 'name': 'test'},
+            ],
+        }
+        res = self.client.post(self.URL, data, format='json')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        statuses = [result['status'] for result in res.data['results']]
+        self.assertEqual(statuses, [
+            status.HTTP_201_CREATED,
+            status.HTTP_200_OK,
+            status.HTTP_400_BAD_REQUEST,
+            status.HTTP_400_BAD_REQUEST,
+            status.HTTP_400_BAD_REQUEST,
+            status.HTTP_400_BAD_REQUEST,
+            status.HTTP_200_OK,
+        ])
+        self.assertEqual(res.data['results'][1]['data'], {'content': 'hello'})
+        self.assertEqual(res.data['results'][5]['data'], 'Unknown command.')
+        self.assertEqual(res.data['results'][6]['data'], {'results': ['/f1/f2/test']})
+
+    def test_batch_then_400_BAD_REQUEST(self):
+        testcases = [
+            {'ops': []},
+            {'ops': [{'cmd': 'cd', 'folder_path': '/'}] * 101},
+            {'ops': 'cd'},
+        ]
+        for data in testcases:
+            res = self.client.post(self.URL, data, format='json')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -13,4 +13,5 @@ urlpatterns = [
     path('up/', views.UpAPIView.as_view(), name='up'),
     path('mv/', views.MvAPIView.as_view(), name='mv'),
     path('rm/', views.RmAPIView.as_view(), name='rm'),
+    path('batch/', views.BatchAPIView.as_view(), name='batch'),
 ]
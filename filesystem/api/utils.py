@@ -1,15 +1,19 @@
 from typing import Dict, Any
 
-from rest_framework.serializers import Serializer
+from filesystem.models import File, format_datetime
 
 
-def get_input_fields(serializer: Serializer) -> Dict[str, Any]:
+def file_to_representation(file: File, name: str = None) -> Dict[str, Any]:
     """
-    Retrieve all input field values from a serializer.
-    :param serializer: a serializer instance
-    :return: a dictionary that contains field values and their corresponding names. Ex: {folder_path: /abc/}
+    Build meta-data of a file for responses: name (with trailing slash for folders), created_at, updated_at, size.
+    :param file: a file instance, it is never modified, as it may be shared with cache.
+    :param name: a name to be displayed instead of the filename.
     """
-    serializer_fields = serializer.fields
-    not_read_only_field_names = [name for name, field in serializer_fields.items() if not field.read_only]
-    results = {name: serializer._validated_data[name] for name in not_read_only_field_names}
-    return results
+    if name is None:
+        name = file.name + '/' if file.is_folder else file.name
+    return {
+        'name': name,
+        'created_at': format_datetime(file.created_at),
+        'updated_at': format_datetime(file.updated_at),
+        'size': file.size,
+    }
@@ -1,50 +1,79 @@
-from typing import List
+import logging
+from typing import List, Dict, Any
 
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.request import Request
 from rest_framework.response import Response
 
 from filesystem import repositories as repo
-from filesystem.exceptions import FileExisted, FileNotFound, InvalidFilename, MovedIntoSubFolder
+from filesystem.exceptions import FileExisted, FileNotFound, InvalidFilename, MovedIntoSubFolder, ConcurrentUpdate
 from . import serializers
-from .utils import get_input_fields
+from .utils import file_to_representation
 from ..models import FilePath
 
+logger = logging.getLogger(__name__)
+
+# Expected exceptions raised by commands, mapped to messages and status codes of their responses
+_ERRORS = {
+    FileExisted: ('File existed.', status.HTTP_400_BAD_REQUEST),
+    FileNotFound: ('No such file or directory.', status.HTTP_400_BAD_REQUEST),
+    InvalidFilename: ('Invalid filename.', status.HTTP_400_BAD_REQUEST),
+    MovedIntoSubFolder: ('Cannot move to a subdirectory of itself.', status.HTTP_400_BAD_REQUEST),
+    ConcurrentUpdate: ('Files were updated concurrently, please try again.', status.HTTP_409_CONFLICT),
+}
+_EXPECTED_ERRORS = tuple(_ERRORS)
+
 
 class CommandAPIView(GenericAPIView):
     """
     Generic API view that handles request containing command.
     """
+    _cached_serializer_class = None
+
+    def __init_subclass__(cls, **kwargs):
+        """
+        Serializer class of a command never changes, so we resolve it once when the view class is defined instead of
+        calling get_serializer_class on every request.
+        """
+        super().__init_subclass__(**kwargs)
+        cls._cached_serializer_class = cls.serializer_class
 
     def post(self, request: Request, *args, **kwargs) -> Response:
         """
         All commands are sent within POST requests,
         because length of command arguments may exceed the limit of a GET request.
+        :return a HTTP response that contains result of the command or message of exception.
+        """
+        return self.execute(request.data)
+
+    def execute(self, data: Dict[str, Any]) -> Response:
+        """
+        Validate arguments of the command and run it.
         Here we handle exceptions and return corresponding responses:
             - FileExisted
             - FileNotFound
             - InvalidFilename
             - MovedIntoSubFolder
+            - ConcurrentUpdate
         See filesystem/exceptions for more information.
+        :param data: raw arguments of the command.
         :return a HTTP response that contains result of the command or message of exception.
+        :exception ValidationError: raised when the arguments are invalid.
         Note: Dont modify File instances without saving them. Serializer has side effect of updating cache.
         """
-        serializer_class = self.get_serializer_class()
-        serializer = serializer_class(data=request.data)
+        serializer = self._cached_serializer_class(data=data)
         if serializer.is_valid(raise_exception=True):
             try:
-                return self.handle(**get_input_fields(serializer))
-            except FileExisted:
-                return Response(data='File existed.', status=status.HTTP_400_BAD_REQUEST)
-            except FileNotFound:
-                return Response(data='No such file or directory.', status=status.HTTP_400_BAD_REQUEST)
-            except InvalidFilename:
-                return Response(data='Invalid filename.', status=status.HTTP_400_BAD_REQUEST)
-            except MovedIntoSubFolder:
-                return Response(data='Cannot move to a subdirectory of itself.', status=status.HTTP_400_BAD_REQUEST)
-            except Exception as e:
-                print(e)
+                # Read-only fields never appear in validated data, so it holds exactly the arguments of the command
+                return self.handle(**serializer.validated_data)
+            except _EXPECTED_ERRORS as e:
+                message, status_code = _ERRORS[type(e)]
+                return Response(data=message, status=status_code)
+            except Exception:
+                logger.exception('Unexpected error while handling command with %s', type(self).__name__)
+                return Response(data='Internal server error.', status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def handle(self, *args, **kwargs) -> Response:
         """
@@ -68,9 +97,7 @@ class CdAPIView(CommandAPIView):
             raise FileNotFound
         if folder_path.path != '/':
             folder_path.path += '/'
-        res_data = {'folder_path': folder_path.path}  # Add trailing slash
-        return Response(data=self.serializer_class(res_data).data,
-                        status=status.HTTP_200_OK)
+        return Response(data={'folder_path': folder_path.path}, status=status.HTTP_200_OK)
 
 
 class CrAPIView(CommandAPIView):
@@ -97,8 +124,7 @@ class CatAPIView(CommandAPIView):
         # Cannot read data of folders
         if file.is_folder:
             raise FileNotFound
-        return Response(data=self.serializer_class({'content': file.data}).data,
-                        status=status.HTTP_200_OK)
+        return Response(data={'content': file.data}, status=status.HTTP_200_OK)
 
 
 class LsAPIView(CommandAPIView):
@@ -112,11 +138,14 @@ class LsAPIView(CommandAPIView):
         folder = repo.get_file(filepath=folder_path)
         if not folder.is_folder:
             raise FileNotFound
-        # Results are sorted alphabetically
-        results = [folder] + sorted(list(folder.get_children()), key=lambda f: f.name)
-        folder.to_dot = True # Change name of the folder to dot (.)
-        return Response(data=self.serializer_class({'items': results}).data,
-                        status=status.HTTP_200_OK)
+        children = folder.get_children()
+        # Results are sorted alphabetically. Names are extracted once and indices are sorted by them, so no Python
+        # key function is called per child.
+        names = [child.name for child in children]
+        order = sorted(range(len(children)), key=names.__getitem__)
+        # The folder itself is displayed as dot (.)
+        items = [file_to_representation(folder, name='.')] + [file_to_representation(children[i]) for i in order]
+        return Response(data={'items': items}, status=status.HTTP_200_OK)
 
 
 class FindAPIView(CommandAPIView):
@@ -128,8 +157,7 @@ class FindAPIView(CommandAPIView):
     def handle(self, folder_path: str, name: str, *args, **kwargs) -> Response:
         folder_path = FilePath(folder_path)
         results = repo.find(name=name, folder_path=folder_path)
-        return Response(data=self.serializer_class({'results': results}).data,
-                        status=status.HTTP_200_OK)
+        return Response(data={'results': results}, status=status.HTTP_200_OK)
 
 
 class UpAPIView(CommandAPIView):
@@ -167,3 +195,40 @@ class RmAPIView(CommandAPIView):
         filepaths = [FilePath(path) for path in paths]
         repo.remove_file(filepaths=filepaths)
         return Response(status=status.HTTP_200_OK)
+
+
+class BatchAPIView(CommandAPIView):
+    """
+    API view that runs many commands within one request, which saves a HTTP round trip per command.
+    Commands are independent from each other and run in order, a failed command does not stop the following ones.
+    """
+    serializer_class = serializers.BatchSerializer
+
+    def handle(self, ops: List[Dict[str, Any]], *args, **kwargs) -> Response:
+        results = []
+        for op in ops:
+            cmd = op.get('cmd')
+            # Any JSON value is accepted as cmd, but only strings can name a command (others can not even be hashed)
+            view_class = BATCH_COMMANDS.get(cmd) if isinstance(cmd, str) else None
+            if view_class is None:
+                response = Response(data='Unknown command.', status=status.HTTP_400_BAD_REQUEST)
+            else:
+                try:
+                    response = view_class().execute(op)
+                except ValidationError as e:
+                    response = Response(data=e.detail, status=status.HTTP_400_BAD_REQUEST)
+            results.append({'status': response.status_code, 'data': response.data})
+        return Response(data={'results': results}, status=status.HTTP_200_OK)
+
+
+# Commands that can be sent within a batch, mapped to the views that handle them
+BATCH_COMMANDS = {
+    'cd': CdAPIView,
+    'cr': CrAPIView,
+    'cat': CatAPIView,
+    'ls': LsAPIView,
+    'find': FindAPIView,
+    'up': UpAPIView,
+    'mv': MvAPIView,
+    'rm': RmAPIView,
+}
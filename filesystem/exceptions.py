@@ -27,3 +27,10 @@ class ForbiddenOperation(Exception):
     """
     Raised when normal files try to call methods, that only support folders
     """
+
+
+class ConcurrentUpdate(Exception):
+    """
+    Raised when files being updated are updated by a concurrent transaction at the same time, so the update can not be
+    serialized with it. The update can simply be sent again.
+    """
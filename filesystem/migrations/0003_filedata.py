@@ -0,0 +1,32 @@
+# Generated by Django 3.1.5 on 2026-10-15 20:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesystem', '0002_file_uniq_parent_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileData',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='filesystem.file')),
+                ('data', models.TextField()),
+            ],
+        ),
+        # Content of existing files is copied over before the column is removed
+        migrations.RunSQL(
+            sql='INSERT INTO filesystem_filedata (file_id, data) '
+                'SELECT id, data FROM filesystem_file WHERE data IS NOT NULL',
+            reverse_sql='UPDATE filesystem_file SET data = d.data FROM filesystem_filedata d '
+                        'WHERE d.file_id = filesystem_file.id',
+        ),
+        migrations.RemoveField(
+            model_name='file',
+            name='data',
+        ),
+    ]
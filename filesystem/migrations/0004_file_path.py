@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('filesystem', '0003_filedata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='path',
+            field=models.TextField(null=True),
+        ),
+        # Filepaths of existing files are built by walking down the tree from the root directory
+        migrations.RunSQL(
+            sql="""
+                WITH RECURSIVE tree(id, path) AS (
+                    SELECT id, '/'::text FROM filesystem_file WHERE parent_id IS NULL
+                    UNION ALL
+                    SELECT f.id, rtrim(tree.path, '/') || '/' || f.name
+                    FROM filesystem_file f JOIN tree ON f.parent_id = tree.id
+                )
+                UPDATE filesystem_file SET path = tree.path FROM tree WHERE filesystem_file.id = tree.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='path',
+            field=models.TextField(unique=True),
+        ),
+    ]
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import datetime
-import json
-import os
-import re
-from pathlib import Path
-from typing import Callable, List, Dict, Union
+import string
+from functools import lru_cache
+from typing import List, Dict, Union, Optional, Sequence, Tuple
 
+import orjson
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import DEFERRED
+from django.db.models.base import ModelState
+from django.db.models import Value
+from django.db.models.functions import Length, Replace, Concat, Substr
 from django.utils import timezone
 
 from filesystem import services as cache
@@ -20,36 +23,99 @@ MAX_PATH_LENGTH = 500  # maximum length of a filepath
 MAX_NAME_LENGTH = 255  # maximum length of a filename
 MAX_CONTENT_LENGTH = 1000  # maximum length of content of a file
 
+# Bytes of all characters, that are allowed in a filename (see FILENAME_REGEX)
+_FILENAME_CHARS = (string.ascii_letters + string.digits + ' _-').encode()
+# Bytes of all characters, that are allowed in a normalized filepath (see FILEPATH_REGEX)
+_FILEPATH_CHARS = _FILENAME_CHARS + b'/'
+_SIZE_INDEX = 7  # Position of size among the fields of a cached file (see File.to_tuple)
+
+
+def _is_valid_filename(name: str) -> bool:
+    """
+    Check whether a filename fully matches FILENAME_REGEX.
+    Deleting all allowed characters from the encoded name must leave nothing behind. bytes.translate scans the name in
+    C, which is much faster than running the regex engine for such short strings.
+    """
+    return name != '' and not name.encode().translate(None, _FILENAME_CHARS)
+
+
+def format_datetime(value: Union[datetime.datetime, str, None]) -> Optional[str]:
+    """
+    Format a timestamp the same way DRF DateTimeField does (ISO 8601, UTC offset written as Z).
+    Timestamps of files loaded from cache are already formatted, so they are returned as is.
+    """
+    if not isinstance(value, datetime.datetime):
+        return value
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def join_path(folder_path: str, name: str) -> str:
+    """
+    Build the normalized filepath of a file from the normalized filepath of its parent folder and its name.
+    """
+    return folder_path.rstrip('/') + '/' + name
+
+
+@lru_cache(maxsize=4096)
+def _clean_path(raw_path: str) -> Optional[str]:
+    """
+    Normalize the raw file path by deleting aliases . (dot), .. (two dots):
+    . (dot) means current directory.
+    .. (two dots) means the parent directory of the current one.
+    :param raw_path: a string of the raw file path.
+    :return: a string of the normalized file path, or None if the normalized version of the raw file path is invalid.
+    A file path is valid if:
+    - It follow the pattern: /{name}/.../{name}
+    - All names in the file path match regex /^[a-zA-Z0-9 _-]+$/
+    Note: filepath '//' will be transformed to '/', so are other repeated slashes, also leading ones.
+    Note: The filepath /dirA/dirB/file.txt/.././ is considered valid and is normalized to /dirA/dirB. This allows
+    long and complex filepaths to be preprocessed and hence processed quickly.
+    Note: Normalization is deterministic, so results of the most recently used raw file paths are memoized. Invalid
+    paths are memoized as well, that is why None is returned instead of raising an exception.
+    """
+    if not raw_path.startswith('/'):
+        return None
+    # Names are walked once, unlike os.path.normpath, there are no relative paths or special leading slashes to handle
+    names = []
+    for name in raw_path.split('/'):
+        if name == '..':
+            if names:
+                names.pop()
+        elif name and name != '.':
+            names.append(name)
+    normalized_path = '/' + '/'.join(names)
+    # A normalized path has no empty names, so it fully matches FILEPATH_REGEX if it is made of allowed characters
+    # only. Like filenames, it is checked by deleting all allowed characters, which is done in C.
+    if normalized_path.encode().translate(None, _FILEPATH_CHARS):
+        return None
+    return normalized_path
+
 
 class FilePath:
     """
     Each instance of this class represents an absolute path in the virtual file system.
     """
+    # Many short-lived instances are created per request, slots make them smaller and faster to create
+    __slots__ = ('path', '_dirs', '_parent')
 
     def __init__(self, raw_path: str) -> None:
         self.path = self._clean(raw_path)
+        self._dirs = None  # See dirs method bellow
+        self._parent = None  # See parent method bellow
 
     @staticmethod
     def _clean(raw_path: str) -> str:
         """
-        Normalize the raw file path by deleting aliases . (dot), .. (two dots):
-        . (dot) means current directory.
-        .. (two dots) means the parent directory of the current one.
+        Normalize the raw file path (see _clean_path).
         :param raw_path: a string of the raw file path.
         :return: a string of the normalized file path.
         :exception FileNotFound: raised if the normalized version of the raw file path is invalid.
-        A file path is valid if:
-        - It follow the pattern: /{name}/.../{name}
-        - All names in the file path match regex /^[a-zA-Z0-9 _-]+$/
-        Note: filepath '//' will be transformed to '/'.
-        Note: The filepath /dirA/dirB/file.txt/.././ is considered valid and is normalized to /dirA/dirB. This allows
-        long and complex filepaths to be preprocessed and hence processed quickly.
-        """
-        normalized_path = os.path.normpath(raw_path)
-        if normalized_path == '//':
-            normalized_path = '/'
-        filepath_pattern = re.compile(FILEPATH_REGEX)
-        if filepath_pattern.fullmatch(normalized_path) is None:
+        """
+        normalized_path = _clean_path(raw_path)
+        if normalized_path is None:
             raise FileNotFound
         return normalized_path
 
@@ -61,20 +127,39 @@ class FilePath:
             //      -> //
             /       -> /
         :return: an FilePath instance contains the filepath of the parent directory
+        Note: Parent of a normalized filepath is normalized as well, so it is built without being normalized again.
+        Note: The parent is built once and shared between calls.
         """
-        path = Path(self.path).parent
-        return FilePath(path)
+        if self._parent is None:
+            index = self.path.rfind('/')
+            parent = FilePath.__new__(FilePath)
+            parent.path = self.path[:index] if index > 0 else '/'
+            parent._dirs = self._dirs[:-1] if self._dirs is not None else None
+            parent._parent = None
+            self._parent = parent
+        return self._parent
 
     def dirs(self) -> List[str]:
         """
         Extract filenames in the filepath.
         Ex: /a/b/c -> [a,b,c]
-        :return: a list of filenames.
+        :return: a list of filenames, which is computed once and shared between calls, so it must not be modified.
+        """
+        if self._dirs is None:
+            filenames = self.path.strip('/').split('/')
+            if filenames == ['']:
+                filenames = []
+            self._dirs = filenames
+        return self._dirs
+
+    def lineage(self) -> List[str]:
         """
-        filenames = self.path.strip('/').split('/')
-        if filenames == ['']:
-            filenames = []
-        return filenames
+        Return filepaths of all directories above a given filepath, top down, followed by the filepath itself.
+        Ex: /a/b/c -> [/, /a, /a/b, /a/b/c]
+        :return: a list of normalized filepaths.
+        """
+        filenames = self.dirs()
+        return ['/'] + ['/' + '/'.join(filenames[:depth]) for depth in range(1, len(filenames) + 1)]
 
 
 class AbstractFile(models.Model):
@@ -84,8 +169,8 @@ class AbstractFile(models.Model):
     """
 
     # Each file has a name, which has max length of 255 characters.
-    # Name should be indexed to accelerate access speed, because we do a lot of look up based on it.
-    name = models.CharField(max_length=MAX_NAME_LENGTH, db_index=True)
+    # Names are always looked up within a parent folder, so they are indexed together with parent (see File.Meta).
+    name = models.CharField(max_length=MAX_NAME_LENGTH)
     # The timestamp when the file is created, automatically set by Django
     created_at = models.DateTimeField(auto_now_add=True)
     # The timestamp when the file is updated, automatically set by Django when the file is updated
@@ -99,25 +184,6 @@ class AbstractFile(models.Model):
         abstract = True
 
 
-def only_folder(method: Callable):
-    """
-    This decorator the class method to be called only if the File instance is a folder.
-    :param method: the class method that is about to be called.
-    :return: a wrapper for the class method.
-    :exception ForbiddenOperation: raised when normal files want to call the method.
-    """
-
-    def wrapper(self: File, *args, **kwargs):
-        """
-        :param self: a instance of File model
-        """
-        if self.is_folder:
-            return method(self, *args, **kwargs)
-        raise ForbiddenOperation
-
-    return wrapper
-
-
 class File(AbstractFile):
     """
     Similar to Unix file system, in this system, a folder (or directory), which is a group of files (neither normal
@@ -132,34 +198,87 @@ class File(AbstractFile):
 
     # If the parent folder is deleted, then all of its children will be deleted too.
     parent = models.ForeignKey('self', related_name="children", on_delete=models.CASCADE, null=True)
-    # A file only contains text data, which can not be blank, but can be null when it is a folder
-    data = models.TextField(null=True)
+    # A file only contains text data, which can not be blank, but can be null when it is a folder.
+    # Data is stored apart from the other fields (see FileData and data property bellow).
     # This field takes True value if the file is a folder. Otherwise, this field takes False value.
     is_folder = models.BooleanField()
+    # The normalized filepath of the file (see FilePath), so that a file is looked up by its filepath within one index
+    # lookup, and files within a folder are found by the prefix of their filepaths. It is maintained when files are
+    # added, moved or renamed.
+    path = models.TextField(unique=True)
+
+    class Meta:
+        constraints = [
+            # Names of files that reside in the same folder are different. The unique index of the constraint also
+            # serves every lookup of a child by its name, so no separate index is needed.
+            models.UniqueConstraint(fields=['parent', 'name'], name='uniq_parent_name'),
+        ]
 
     def __init__(self, *args, **kwargs):
+        self._data = None  # See data property method bellow
+        self._data_changed = False
         super().__init__(*args, **kwargs)
         self._size = None  # See size property method bellow
 
-    def to_json(self):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        file = super().from_db(db, field_names, values)
+        file._data = DEFERRED  # Data is only loaded from database on access
+        return file
+
+    @property
+    def data(self):
         """
-        Convert an object to json
+        Content of the file, or None if it is a folder.
+        It is loaded from database on first access, if the file was loaded without it.
         """
+        if self._data is DEFERRED:
+            self._data = FileData.objects.filter(file_id=self.id).values_list('data', flat=True).first()
+        return self._data
 
-        def default(o):
-            if isinstance(o, (datetime.date, datetime.datetime)):
-                return o.isoformat().replace('+00:00', 'Z')
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._data_changed = True  # See save method bellow
 
-        return json.dumps({
-            'id': self.id,
-            'name': self.name,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'parent_id': self.parent_id,
-            'data': self.data,
-            'is_folder': self.is_folder,
-            '_size': self._size
-        }, default=default)
+    def to_tuple(self) -> Tuple:
+        """
+        Convert an object to a tuple of its fields, followed by its size:
+        (id, name, created_at, updated_at, parent_id, data, is_folder, _size)
+        Data is None if it was not loaded, so that it is not loaded only to be cached (see from_tuple).
+        """
+        data = None if self._data is DEFERRED else self._data
+        # Timestamps are formatted beforehand, so the encoder never has to fall back to a default function
+        return (self.id, self.name, format_datetime(self.created_at), format_datetime(self.updated_at),
+                self.parent_id, data, self.is_folder, self._size)
+
+    def to_bytes(self) -> bytes:
+        """
+        Convert an object to json encoded as UTF-8 bytes, which is an array of its fields (see to_tuple).
+        """
+        return orjson.dumps(self.to_tuple())
+
+    @classmethod
+    def from_tuple(cls, fields: Sequence) -> File:
+        """
+        Convert a sequence of fields (see to_tuple) to a file instance.
+        The instance is built without Model.__init__, which matches values to fields one by one and sends signals.
+        Cached files are saved files, so the instance is in the same state as one loaded from database.
+        Filepaths are not cached, as they change when any ancestor is moved or renamed, so the filepath is loaded from
+        database on access, except the root directory's, which never changes.
+        Data of normal files is never None, so None means it was not loaded, it will be loaded from database on access.
+        """
+        id, name, created_at, updated_at, parent_id, data, is_folder, size = fields
+        file = cls.__new__(cls)
+        file.__dict__.update(
+            id=id, name=name, created_at=created_at, updated_at=updated_at, parent_id=parent_id, is_folder=is_folder,
+            _state=ModelState(), _data=DEFERRED if data is None and not is_folder else data, _data_changed=False,
+            _size=size,
+        )
+        if parent_id is None:
+            file.path = '/'
+        file._state.adding = False
+        return file
 
     def clean(self):
         """
@@ -171,15 +290,16 @@ class File(AbstractFile):
         :raise ValidationError when the conditions are violated.
         :raise InvalidFilename if the name is invalid.
         """
-        if (self.is_folder and self.data is not None) or (not self.is_folder and self.data is None):
+        # Data, that was not loaded, is unchanged since it was validated
+        data = self._data
+        if data is not DEFERRED and ((self.is_folder and data is not None) or (not self.is_folder and data is None)):
             raise ValidationError('a file contains wrong data')
         if self.parent_id is None:
             raise ValidationError('a file must have one parent')
         if not self.parent.is_folder:
             raise ValidationError('a file can not contain other files')
 
-        pattern = re.compile(FILENAME_REGEX)
-        if pattern.fullmatch(self.name) is None:
+        if not _is_valid_filename(self.name):
             raise InvalidFilename
 
     def save(self, *args, **kwargs):
@@ -193,37 +313,140 @@ class File(AbstractFile):
         """
         if 'force_insert' not in kwargs and 'force_update' not in kwargs:
             self.clean()
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        # Data is written to its own table only when it is changed
+        if self._data_changed and not self.is_folder:
+            if adding:
+                FileData.objects.create(file_id=self.id, data=self._data)
+            else:
+                FileData.objects.filter(file_id=self.id).update(data=self._data)
+            self._data_changed = False
+
+    @classmethod
+    def resolve_path(cls, filepath: FilePath) -> File:
+        """
+        Retrieve the file at a filepath within one index lookup, instead of looking up its ancestors level by level.
+        :param filepath: a normalized filepath.
+        :return: the file instance at the filepath.
+        :exception FileNotFound: raised when no file or directory match the filepath.
+        """
+        try:
+            return cls.objects.get(path=filepath.path)
+        except File.DoesNotExist:
+            raise FileNotFound
+
+    @classmethod
+    def resolve_lineages(cls, filepaths: List[FilePath]) -> Dict[str, File]:
+        """
+        Retrieve the files at many filepaths, together with all of their ancestors, within one query (see resolve_path).
+        :param filepaths: a list of normalized filepaths.
+        :return: a dictionary, that maps filepaths to file instances. Filepaths that do not exist are missing.
+        """
+        paths = {path for filepath in filepaths for path in filepath.lineage()}
+        return {file.path: file for file in cls.objects.filter(path__in=paths)}
+
+    @classmethod
+    def resolve_prefix(cls, filepath: FilePath) -> Tuple[Optional[File], int]:
+        """
+        Retrieve the deepest existing file along a filepath within one query (see resolve_path).
+        :param filepath: a normalized filepath.
+        :return: the deepest file found and the number of filenames of the filepath it matches. The file is the root
+        directory if not even the first filename exists, or None if the root directory does not exist yet.
+        """
+        paths = filepath.lineage()
+        file = cls.objects.filter(path__in=paths).order_by(Length('path').desc()).first()
+        if file is None:
+            return None, 0
+        return file, paths.index(file.path)
+
+    @classmethod
+    def ancestor_ids(cls, file_id: int) -> List[int]:
+        """
+        Retrieve ids of a file and all of its ancestors up to the root directory (bottom up) within one query.
+        :param file_id: id of the file.
+        :return: a list of ids, which is empty if the file does not exist.
+        """
+        query = """
+            WITH RECURSIVE chain(id, parent_id) AS (
+                SELECT id, parent_id FROM {table} WHERE id = %s
+                UNION ALL
+                SELECT f.id, f.parent_id FROM {table} f JOIN chain ON f.id = chain.parent_id
+            )
+            SELECT id FROM chain
+        """.format(table=cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(query, [file_id])
+            return [row[0] for row in cursor.fetchall()]
 
-    @only_folder
     def get_children(self) -> List[File]:
         """
         Only work for folders.
         Retrieve all children (neither folders and normal files) that are direct children of the folder.
         :return: a queryset of File instances.
         Note: Return an empty queryset if the folder has none children.
+        :exception ForbiddenOperation: raised when the file is not a folder.
         """
-        cache_children_ids = cache.get_children_ids(folder_id=self.id)
-        if cache_children_ids:
-            children = [self._get_child_by_id(id) for id in cache_children_ids]
+        if not self.is_folder:
+            raise ForbiddenOperation
+        cache_children = cache.get_children(folder_id=self.id)
+        if cache_children is not None:
+            # Data of all children is fetched along with their ids, the ones missing in cache are then loaded within
+            # one query
+            cache_children_ids, cache_data = cache_children
+            missing_ids = [id for id, data in zip(cache_children_ids, cache_data) if not data]
+            loaded = {}
+            if missing_ids:
+                loaded = {child.id: child for child in self._load_children(id__in=missing_ids)}
+                cache.set_many_data(loaded.values())
+            # Children, that are neither in cache nor in database anymore, are skipped
+            children = [File.from_tuple(data) if data else loaded[id]
+                        for id, data in zip(cache_children_ids, cache_data) if data or id in loaded]
             return children
         else:
-            children = list(self.children.all())
+            children = self._load_children()
             cache.set_children(self.id, children)
             return children
 
-    @only_folder
-    def _get_child_by_id(self, file_id: int) -> File:
-        cache_data = cache.get_data(file_id=file_id)
-        if cache_data:
-            file = dict_to_file(cache_data)
-            return file
-        else:
-            file = self.children.get(id=file_id)
-            cache.set_data(file)
-            return file
+    def descendants(self, name: str, max_level: Optional[int]) -> List[Tuple[str, bool]]:
+        """
+        Only work for folders.
+        Search all files within the folder down to max_level, whose name contains the substring NAME, within one
+        query on the prefix of their filepaths, instead of listing sub-folders one by one. Children of the folder are
+        at level 1.
+        :param name: a string that filenames must contain. If name is blank, all files within max_level match.
+        :param max_level: an integer of the deepest level to search, or None to search all levels.
+        :return: a list of filepaths and is_folder flags of the matching files, in no particular order.
+        :exception ForbiddenOperation: raised when the file is not a folder.
+        """
+        if not self.is_folder:
+            raise ForbiddenOperation
+        files = File.objects.filter(path__startswith=self.path.rstrip('/') + '/')
+        if name:
+            # Every name contains a blank substring, so the files are not filtered by name at all then
+            files = files.filter(name__contains=name)
+        if max_level is not None:
+            # Level of a file is the number of slashes in its filepath, minus the folder's (which is 0 for root)
+            level = self.path.count('/') if self.parent_id else 0
+            files = files.annotate(
+                depth=Length('path') - Length(Replace('path', Value('/'), Value(''))),
+            ).filter(depth__lte=level + max_level)
+        return list(files.exclude(id=self.id).values_list('path', 'is_folder'))
+
+    def _load_children(self, **filters) -> List[File]:
+        """
+        Only work for folders, which is checked by the callers.
+        Load children of the folder from database within one query.
+        Data of children is not loaded, only its length is, which is all listings need to know about it.
+        :param filters: optional lookups to narrow down the children.
+        :return: a list of File instances.
+        """
+        children = list(self.children.filter(**filters).annotate(data_length=Length('content__data')))
+        for child in children:
+            if not child.is_folder:
+                child._size = child.data_length
+        return children
 
-    @only_folder
     def get_child(self, filename: str) -> File:
         """
         Only work for folders.
@@ -231,56 +454,96 @@ class File(AbstractFile):
         :param filename: a string of the desired filename.
         :return: an instance of the desired file.
         :exception FileNotFound: raised when the file with desired name does not exist.
+        :exception ForbiddenOperation: raised when the file is not a folder.
         """
+        if not self.is_folder:
+            raise ForbiddenOperation
         try:
-            children = self.get_children()
-            if children:
-                # Search child by name
-                child = next((child for child in children if child.name == filename), None)
-                if child:
-                    return child
-                raise FileNotFound
-            else:
-                return self.children.get(name=filename)
+            # Names are unique within a folder (see File.Meta), so the child is looked up within one index lookup
+            return self.children.get(name=filename)
         except File.DoesNotExist:
             raise FileNotFound
 
-    @only_folder
-    def add_child(self, file: File) -> None:
+    def add_child(self, file: File, pipe=None) -> None:
         """
         Only work for folders.
         Set parent of the file to the current folder.
         This method should be wrap in a transaction to ensure atomicity.
         :param file: an instance of Folder or File models, it can be either saved or not.
+        :param pipe: an optional Redis pipeline, on which cache updates are queued (see services).
         :exception FileExisted: raised when the name of the child is duplicated in the folder.
+        :exception ForbiddenOperation: raised when the file is not a folder.
         """
+        if not self.is_folder:
+            raise ForbiddenOperation
+        # The file would be saved onto its own row, so the database can not reject it as a duplicated name
+        if file.parent_id == self.id:
+            raise FileExisted
+        old_parent_id = file.parent_id
+        old_path = None
+        if old_parent_id:  # when move files
+            # Ancestors must be looked up before the file leaves them
+            old_ancestor_ids = File.ancestor_ids(file.id)
+            old_path = file.path
+        file.parent = self
+        file.path = join_path(self.path, file.name)
+        # Duplicated names are rejected by the database (see File.Meta), instead of being looked up beforehand
         try:
-            self.get_child(file.name)
+            with transaction.atomic():
+                file.save()
+                if old_path and file.is_folder:
+                    file.update_descendant_paths(old_path)
+        except IntegrityError:
+            file.parent_id = old_parent_id
+            file.path = old_path
             raise FileExisted
-        except FileNotFound:
-            if file.parent_id:
-                cache.rm_child(file.parent_id, file.id)  # when move files
-            file.parent = self
-            file.save()
-            self.updated_at = timezone.now()
-            self.save(force_update=True)
-            cache.add_child(folder=self, file=file)
-
-    @only_folder
-    def remove_child(self, filename: str) -> None:
+        if old_parent_id:
+            cache.rm_child(old_parent_id, file.id, old_ancestor_ids, pipe=pipe)
+        self._touch()
+        # A new folder is empty, so sizes of the folder and its ancestors do not change, and they need not be looked up
+        ancestor_ids = File.ancestor_ids(self.id) if old_parent_id or not file.is_folder else None
+        cache.add_child(folder=self, file=file, ancestor_ids=ancestor_ids, pipe=pipe)
+
+    def remove_child(self, filename: str, pipe=None) -> None:
         """
         Only work for folders.
         Delete a direct child of the folder based on its name.
         This method should be wrap in a transaction to ensure atomicity. One reason is that cascading delete may fail
         in the middle of the process.
         :param filename: a string of the name of the child, which is about to be deleted.
+        :param pipe: an optional Redis pipeline, on which cache updates are queued (see services).
+        :exception FileNotFound: raised when the folder has no child with the name.
+        :exception ForbiddenOperation: raised when the file is not a folder.
         """
+        if not self.is_folder:
+            raise ForbiddenOperation
         # Should preserve this order for correct cache invalidation
+        # The child is never loaded as a model instance, only its id is needed
+        children = self.children.filter(name=filename)
+        child_id = children.values_list('id', flat=True).first()
+        if child_id is None:
+            raise FileNotFound
+        cache.rm_child(folder_id=self.id, file_id=child_id, ancestor_ids=File.ancestor_ids(child_id), pipe=pipe)
+        children.delete()
+        self._touch()
+
+    def update_descendant_paths(self, old_path: str) -> None:
+        """
+        Update filepaths of all files within the folder, after its own filepath was changed, within one query.
+        This method should be wrap in the same transaction as the change of the folder's filepath.
+        :param old_path: the filepath of the folder before it was changed.
+        """
+        File.objects.filter(path__startswith=old_path + '/').update(
+            path=Concat(Value(self.path), Substr('path', len(old_path) + 1), output_field=models.TextField()),
+        )
+
+    def _touch(self) -> None:
+        """
+        Set updated_at of the file to now.
+        Only this column is written, instead of saving (and validating) all fields of the file.
+        """
         self.updated_at = timezone.now()
-        child = self.get_child(filename)
-        cache.rm_child(folder_id=self.id, file_id=child.id)
-        child.delete()
-        self.save(force_update=True)
+        File.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
 
     @property
     def size(self):
@@ -292,28 +555,58 @@ class File(AbstractFile):
         """
         # check data in cache
         cache_data = cache.get_data(file_id=self.id)
-        if cache_data and cache_data['_size'] is not None:
-            self._size = cache_data['_size']
+        if cache_data and cache_data[_SIZE_INDEX] is not None:
+            self._size = cache_data[_SIZE_INDEX]
         else:
             if not self.is_folder:
-                self._size = len(self.data)
+                # Size may be known already without loading data (see get_children)
+                if self._size is None and self._data is DEFERRED:
+                    # Data is measured by database instead of being loaded only to be measured
+                    self._size = File._lengths([self.id]).get(self.id, 0)
+                elif self._size is None:
+                    self._size = len(self.data)
             else:
-                self._size = 0
-                for child in self.get_children():
-                    self._size += child.size
+                self._size = self._subtree_size()
 
         cache.set_data(file=self)  # update size
         return self._size
 
+    @classmethod
+    def _lengths(cls, file_ids: List[int]) -> Dict[int, int]:
+        """
+        Compute lengths of data of many normal files within one query, without fetching the data.
+        :param file_ids: a list of ids of normal files.
+        :return: a dict maps the id of each existing file to the length of its data.
+        """
+        return dict(FileData.objects.filter(file_id__in=file_ids).values_list('file_id', Length('data')))
 
-def dict_to_file(dict: Dict) -> Union[File]:
+    def _subtree_size(self) -> int:
+        """
+        Only work for folders, which is checked by the callers.
+        Compute the total size of all normal files within the folder (at any level) within one query, instead of
+        visiting its sub-folders one by one.
+        :return: an integer of the total size.
+        """
+        query = """
+            WITH RECURSIVE subtree(id) AS (
+                SELECT id FROM {table} WHERE parent_id = %s
+                UNION ALL
+                SELECT f.id FROM {table} f JOIN subtree ON f.parent_id = subtree.id
+            )
+            SELECT COALESCE(SUM(LENGTH(d.data)), 0) FROM {data_table} d JOIN subtree ON d.file_id = subtree.id
+        """.format(table=self._meta.db_table, data_table=FileData._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(query, [self.id])
+            return cursor.fetchone()[0]
+
+
+class FileData(models.Model):
     """
-    Convert a dict to a file instance
+    Content of a normal file. It is stored apart from the file, so that rows of files, which are read by every lookup
+    and traversal, only hold meta-data. Folders have no content.
     """
-    size = None
-    if '_size' in dict:
-        size = dict.pop('_size')
-    file = File(**dict)
-    if size:
-        file._size = size
-    return file
+
+    # If the file is deleted, then its content will be deleted too.
+    file = models.OneToOneField(File, related_name='content', on_delete=models.CASCADE, primary_key=True)
+    # A file only contains text data, which can not be blank
+    data = models.TextField()
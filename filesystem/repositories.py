@@ -1,11 +1,31 @@
-from queue import SimpleQueue
+import functools
 from typing import AnyStr, List
 
-from django.db import transaction
+from django.db import transaction, IntegrityError, OperationalError
+from django.utils import timezone
+from psycopg2 import errors
 
 from filesystem import services as cache
-from .exceptions import FileNotFound, FileExisted, ForbiddenOperation, MovedIntoSubFolder
-from .models import FilePath, File, dict_to_file
+from .exceptions import FileNotFound, FileExisted, MovedIntoSubFolder, ConcurrentUpdate
+from .models import FilePath, File, join_path
+
+
+def _fail_on_concurrent_update(func):
+    """
+    Raise ConcurrentUpdate instead of the database error, when a transaction of the decorated function can not be
+    serialized with a concurrent one. This happens under Repeatable Read isolation level, when both update the same
+    files, for example when a folder is moved or renamed (filepaths of all files within the folder are updated), while
+    a file within the folder is updated.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if isinstance(e.__cause__, (errors.SerializationFailure, errors.DeadlockDetected)):
+                raise ConcurrentUpdate from e
+            raise
+    return wrapper
 
 
 def _get_root_directory() -> File:
@@ -14,19 +34,15 @@ def _get_root_directory() -> File:
     If it does not exist, then the reason must be that the database has just been newly created, so create a new one.
     :return: a file instance of root directory.
     """
-    # Transaction with serializable isolation level guarantees that there will be no race condition, that means that
-    # there will be only one root directory created.
-    with transaction.atomic(using='serializable'):
-        try:
-            cache_root = cache.get_root_data()
-            if cache_root:
-                return dict_to_file(cache_root)
-            root = File.objects.get(name='/')
-            cache.set_root_data(root)
-        except File.DoesNotExist:
-            root = File.objects.create(name='/', is_folder=True)
-            cache.set_root_data(root)
-        return root
+    cache_root = cache.get_root_data()
+    if cache_root:
+        return File.from_tuple(cache_root)
+    # There will be only one root directory created, because filepaths are unique: a concurrent transaction creating
+    # another one fails on the filepath '/', then get_or_create retrieves the root directory that won instead. If the
+    # snapshot of the enclosing transaction is older than that root directory, the IntegrityError is raised instead.
+    root, _ = File.objects.get_or_create(parent=None, name='/', defaults={'is_folder': True, 'path': '/'})
+    cache.set_root_data(root)
+    return root
 
 
 def get_file(filepath: FilePath) -> File:
@@ -36,17 +52,13 @@ def get_file(filepath: FilePath) -> File:
     :return: a desired file instance.
     :exception FileNotFound: raised when no file or directory match the filepath.
     """
-    current_file = _get_root_directory()
-    filenames = filepath.dirs()  # Normalize and extract filenames from the filepath
-    # Traverse the filepath
-    for filename in filenames:
-        try:
-            current_file = current_file.get_child(filename)
-        except (File.DoesNotExist, ForbiddenOperation):
-            raise FileNotFound
-    return current_file
+    if not filepath.dirs():
+        return _get_root_directory()
+    # The whole filepath is resolved within one query instead of one lookup per level
+    return File.resolve_path(filepath)
 
 
+@_fail_on_concurrent_update
 def create_file(filepath: FilePath, p_flag: bool = False, data: AnyStr = None) -> File:
     """
     This method allows us to create a new file at filepath.
@@ -57,6 +69,7 @@ def create_file(filepath: FilePath, p_flag: bool = False, data: AnyStr = None) -
     :return: A newly created file.
     :exception FileNotFound: raised if the parent folders are missing.
     :exception FileExisted: raised if the filename is duplicated.
+    :exception ConcurrentUpdate: raised if a concurrent transaction updates the same files at the same time.
     """
     if filepath.path == '/':
         raise FileExisted
@@ -70,26 +83,26 @@ def create_file(filepath: FilePath, p_flag: bool = False, data: AnyStr = None) -
             parent_folder = get_file(filepath=filepath.parent())
             parent_folder.add_child(new_file)
     else:
-        current_file = _get_root_directory()
         # Traverse the parent folder's filepath
         filenames = filepath.parent().dirs()
         # We need a transaction here to avoid concurrent transaction deleting parent folder right before we add the
         # child to it
         with transaction.atomic():
-            for filename in filenames:
-                # Create folder if it does not exist
-                try:
-                    current_file = current_file.get_child(filename)
-                except FileNotFound:
-                    tmp_file = File(name=filename, is_folder=True)
-                    current_file.add_child(tmp_file)
-                    current_file = tmp_file
-                except ForbiddenOperation:
-                    raise FileNotFound
+            # Existing parent folders are found within one query, only the missing ones are then created one by one
+            current_file, depth = File.resolve_prefix(filepath.parent())
+            if current_file is None:
+                current_file = _get_root_directory()
+            if not current_file.is_folder:
+                raise FileNotFound
+            for filename in filenames[depth:]:
+                tmp_file = File(name=filename, is_folder=True)
+                current_file.add_child(tmp_file)
+                current_file = tmp_file
             current_file.add_child(new_file)
     return new_file
 
 
+@_fail_on_concurrent_update
 def update_file(filepath: FilePath, new_name: AnyStr, new_data: AnyStr = None) -> File:
     """
     This method allows us to update an existing file at filepath.
@@ -100,34 +113,63 @@ def update_file(filepath: FilePath, new_name: AnyStr, new_data: AnyStr = None) -
     If data is None, then no need to update. If the file is a folder, just ignore the data.
     :return: The updated file.
     :exception FileNotFound: raised if the parent folders are missing.
+    :exception FileExisted: raised if the new name is duplicated in the parent folder.
+    :exception ConcurrentUpdate: raised if a concurrent transaction updates the same files at the same time.
     """
     file = get_file(filepath)
+    old_path = file.path
     file.name = new_name
+    file.path = join_path(filepath.parent().path, new_name)
     if not file.is_folder and new_data:
         file.data = new_data
         file._size = len(new_data)
-    file.save()
-    cache.set_data(file)  # invalidate cache
-    cache.bubble_delete(file.parent_id, cache.get_root_id())  # size may change, so delete all files bottom up
+    try:
+        with transaction.atomic():
+            file.save()
+            if file.is_folder:
+                file.update_descendant_paths(old_path)
+    except IntegrityError:
+        raise FileExisted
+    # Cache updates are sent in one round trip
+    pipe = cache.r.pipeline(transaction=False)
+    cache.set_data(file, pipe=pipe)  # invalidate cache
+    # Size may change, so delete all files bottom up
+    cache.bubble_delete(File.ancestor_ids(file.parent_id), pipe=pipe)
+    pipe.execute()
     return file
 
 
+@_fail_on_concurrent_update
 def remove_file(filepaths: List[FilePath]) -> None:
     """
     This method allows us to delete files, that exist at filepath in the list of filepaths.
-    This method is not fully atomic, but it guarantees that each deletion of a filepath is atomic.
+    This method is atomic, either all files are deleted or none of them.
     :param filepaths: list of normalized filepaths.
-    :exception FileNotFound: raised if the file at filepath does not exist.
-    Method will stop immediately when it encounters an exception.
+    :exception FileNotFound: raised if the file at filepath does not exist. A filepath within a folder, that is deleted
+    earlier in the list, does not exist anymore by its turn. The root directory can not be deleted.
+    :exception ConcurrentUpdate: raised if a concurrent transaction updates the same files at the same time.
     """
+    removed_paths = set()
     for filepath in filepaths:
-        parent_filepath = filepath.parent()
-        filename = filepath.dirs()[-1]
-        with transaction.atomic():
-            parent_folder = get_file(parent_filepath)
-            parent_folder.remove_child(filename)
+        if filepath.path == '/' or any(path in removed_paths for path in filepath.lineage()):
+            raise FileNotFound
+        removed_paths.add(filepath.path)
+    # All deletions are committed at once, and their cache updates are then sent in one round trip
+    pipe = cache.r.pipeline(transaction=False)
+    with transaction.atomic():
+        # All filepaths are resolved within one query, together with their ancestors, whose cache is invalidated
+        lineages = File.resolve_lineages(filepaths)
+        if not removed_paths.issubset(lineages):
+            raise FileNotFound
+        files = [lineages[path] for path in removed_paths]
+        cache.rm_children(files, ancestor_ids=[file.id for file in lineages.values()], pipe=pipe)
+        File.objects.filter(pk__in=[file.id for file in files]).delete()
+        # Touch all parent folders with one query
+        File.objects.filter(pk__in={file.parent_id for file in files}).update(updated_at=timezone.now())
+    pipe.execute()
 
 
+@_fail_on_concurrent_update
 def move_file(filepath: FilePath, folder_path: FilePath) -> None:
     """
     Move a file into the destination folder_path.
@@ -136,17 +178,21 @@ def move_file(filepath: FilePath, folder_path: FilePath) -> None:
     :exception FileNotFound raised when the the file being moved or the folder does not exist, or the file at the
     folder_path is a normal file.
     :exception MoveIntoSubFolder raised when the folder_path is sub-path of filepath.
+    :exception ConcurrentUpdate: raised if a concurrent transaction updates the same files at the same time.
     """
     if folder_path.path.startswith(filepath.path):
         raise MovedIntoSubFolder
     # Transaction is needed to provide atomicity and guarantee file and folder are not deleted by concurrent transaction
     # during moving
+    # Cache updates are sent in one round trip once the move is committed
+    pipe = cache.r.pipeline(transaction=False)
     with transaction.atomic():
         file = get_file(filepath)
         folder = get_file(folder_path)
         if not folder.is_folder:
             raise FileNotFound
-        folder.add_child(file)
+        folder.add_child(file, pipe=pipe)
+    pipe.execute()
 
 
 def find(name: AnyStr, folder_path: FilePath = FilePath('/'), max_level: int = 10) -> List[AnyStr]:
@@ -155,34 +201,19 @@ def find(name: AnyStr, folder_path: FilePath = FilePath('/'), max_level: int = 1
     :param name: a string that filenames must contain. If name is blank, return all files within the folder.
     :param folder_path: the path of folder that we search in
     :param max_level: an integer, which indicates how many levels we can traverse down the file tree to search. This is
-    important to find a reasonable value, because the find method uses transaction to ensure files are not deleted by
-    concurrent transaction, which can cause errors during searching, hence performance is downgraded.
+    important to find a reasonable value, because the whole tree within max_level is walked by one query.
     :return: an alphabetically sorted list of filenames, or an empty list if there are no results.
     :exception FileNotFound: raised if the folder at folder_path is a normal file
     Note: root cannot be search.
     """
-    with transaction.atomic():
-        folder = get_file(folder_path)
-        if not folder.is_folder:
-            raise FileNotFound
-        # Traverse down the file "tree" and search for NAME
-        results = []
-        # Implementation uses breadth-first search (BFS) technique
-        folders = SimpleQueue()
-        # A queue used for BFS, each item in folders contains a current folder instance, a current filepath, and a
-        # current level
-        folders.put(
-            (folder, folder_path.path.rstrip('/'), 0))  # For special case when search in root folder
-        while not folders.empty():
-            cur_folder, cur_path, cur_level = folders.get()
-            if cur_level == max_level:
-                continue
-            for child in cur_folder.get_children():
-                filepath = '{}/{}'.format(cur_path, child.name)
-                if name in child.name:
-                    results.append('{}{}'.format(filepath, '/' if child.is_folder else ''))  # add trailing slash
-                if child.is_folder:
-                    folders.put((child, filepath, cur_level + 1))
-        if name == '':
-            results.append('{}/'.format(folder_path.path.rstrip('/')))
-        return sorted(results)
+    # No transaction is needed: the whole file "tree" of the folder is searched within one query, which sees one
+    # consistent snapshot. If the folder is deleted concurrently right after it is found, nothing is found in it.
+    folder = get_file(folder_path)
+    if not folder.is_folder:
+        raise FileNotFound
+    results = [filepath + '/' if is_folder else filepath  # add trailing slash
+               for filepath, is_folder in folder.descendants(name=name, max_level=max_level)]
+    if name == '':
+        results.append(folder_path.path.rstrip('/') + '/')  # For special case when search in root folder
+    results.sort()
+    return results
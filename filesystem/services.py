@@ -1,11 +1,23 @@
-import json
-
+import orjson
 import redis
 from decouple import config
 from django.conf import settings
 
-r = redis.StrictRedis(host=config('REDIS_HOST'), port=config('REDIS_PORT'), password=config('REDIS_PASSWORD'),
-                      db=0, decode_responses=True)
+__all__ = [
+    'r', 'connect', 'get_root_id', 'get_root_data', 'set_root_data', 'set_data', 'set_many_data', 'get_data',
+    'get_children', 'set_children', 'add_child', 'rm_child', 'rm_children', 'bubble_delete',
+]
+
+
+def connect(db):
+    """
+    Create a client of a Redis database. Responses are not decoded (see bellow).
+    """
+    return redis.StrictRedis(host=config('REDIS_HOST'), port=config('REDIS_PORT'), password=config('REDIS_PASSWORD'),
+                             db=db, decode_responses=False)
+
+
+r = connect(settings.REDIS_DB)
 
 
 
@@ -14,20 +26,37 @@ File system is stored in Redis with structure:
 root = id
 file-id:children = set{child_1_id, child_2_id, ...}
 file-id:data = file
-where file = json{id, name, created_at, updated_at, size, data, is_folder, parent_id, _size}
+file-id:empty = 1, only if the folder is known to have no children (Redis does not keep empty sets)
+where file = json[id, name, created_at, updated_at, parent_id, data, is_folder, _size] (see File.to_tuple)
+Responses are not decoded, as json is parsed from bytes directly and ids are parsed by int.
+
+Functions that write to cache accept an optional pipeline (pipe). If it is given, the writes are queued on the pipeline
+and sent in one round trip when the caller executes it, otherwise they are sent right away. Reads are never queued, as
+their results are needed immediately.
 """
 
 
+# The root directory is never replaced once it is created, so its id is also kept in process memory
+_root_id = None
+
+
 def get_root_id():
-    id = r.get('root_id')
-    if id:
-        return int(id)
-    return None
+    """
+    Get id of the root directory. It is read from cache only until it is known by the process.
+    """
+    global _root_id
+    if _root_id is None:
+        id = r.get('root_id')
+        if id:
+            _root_id = int(id)
+    return _root_id
 
 
 def get_root_data():
     """
     Return root directory instance.
+    If the root directory is not in cache, None is returned and the caller loads it from database (and sets it again),
+    which also replaces the id kept in process memory, in case the database was recreated.
     """
     root_id = get_root_id()
     if root_id:
@@ -39,15 +68,27 @@ def set_root_data(root_file):
     """
     Add root directory to cache.
     """
+    global _root_id
+    _root_id = root_file.id
     r.set('root_id', root_file.id, ex=settings.REDIS_DEFAULT_TTL)
-    r.set('{}:data'.format(root_file.id), root_file.to_json(), ex=settings.REDIS_DEFAULT_TTL)
+    r.set('{}:data'.format(root_file.id), root_file.to_bytes(), ex=settings.REDIS_DEFAULT_TTL)
 
 
-def set_data(file):
+def set_data(file, pipe=None):
     """
     Add file data to cache.
     """
-    r.set('{}:data'.format(file.id), file.to_json(), ex=settings.REDIS_DEFAULT_TTL)
+    (pipe or r).set('{}:data'.format(file.id), file.to_bytes(), ex=settings.REDIS_DEFAULT_TTL)
+
+
+def set_many_data(files):
+    """
+    Add data of many files to cache within one round trip.
+    """
+    pipe = r.pipeline(transaction=False)
+    for file in files:
+        set_data(file, pipe=pipe)
+    pipe.execute()
 
 
 def get_data(file_id):
@@ -56,61 +97,99 @@ def get_data(file_id):
     """
     dump = r.get('{}:data'.format(file_id))
     if dump:
-        data = json.loads(dump)
+        data = orjson.loads(dump)
         return data
     return None
 
 
-def get_children_ids(folder_id):
+def get_children(folder_id):
     """
-    Get all children within a folder from cache.
+    Get all children within a folder and their data from cache within two round trips, one for the ids of the children
+    and one for their data.
+    Return None if children of the folder are not in cache. Otherwise, return a list of children ids and a list of
+    their data in the same order, that contains None for files which are not in cache. Both lists are empty if the
+    folder is known to be empty.
     """
-    children_ids = r.smembers('{}:children'.format(folder_id))
-    if children_ids:
-        return [int(id) for id in children_ids]
-    return None
+    pipe = r.pipeline(transaction=False)
+    pipe.smembers('{}:children'.format(folder_id))
+    pipe.exists('{}:empty'.format(folder_id))
+    children_ids, empty = pipe.execute()
+    if not children_ids:
+        return ([], []) if empty else None
+    children_ids = [int(id) for id in children_ids]
+    dumps = r.mget(['{}:data'.format(id) for id in children_ids])
+    return children_ids, [orjson.loads(dump) if dump else None for dump in dumps]
 
 
 def set_children(folder_id, children):
     """
-    Set children for a folder in cache.
+    Set children for a folder in cache within one round trip.
+    A folder without children is marked as empty, so that it is not looked up in database again.
     """
-    for child in children:
-        r.sadd('{}:children'.format(folder_id), child.id)
+    if children:
+        r.sadd('{}:children'.format(folder_id), *[child.id for child in children])
+    else:
+        r.set('{}:empty'.format(folder_id), 1, ex=settings.REDIS_DEFAULT_TTL)
 
 
-def add_child(folder, file):
+def add_child(folder, file, ancestor_ids=None, pipe=None):
     """
     Add a child item into a folder.
-    """
-    r.sadd('{}:children'.format(folder.id), file.id)
-    set_data(file)
-    if file.is_folder:
-        set_data(folder)  # update updated_at
+    :param ancestor_ids: ids of the folder and all of its ancestors (see bubble_delete), if size of the folder changes.
+    """
+    # Without a pipeline from the caller, all updates are still sent at once, and applied atomically, so that readers
+    # never see the child without its data
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = r.pipeline()
+    pipe.delete('{}:empty'.format(folder.id))
+    pipe.sadd('{}:children'.format(folder.id), file.id)
+    set_data(file, pipe=pipe)
+    if ancestor_ids:
+        bubble_delete(ancestor_ids, pipe=pipe)  # invalidate cache as size may change
     else:
-        bubble_delete(folder.id, root_id=get_root_id())  # invalidate cache as size may change
+        set_data(folder, pipe=pipe)  # update updated_at
+    if own_pipe:
+        pipe.execute()
 
 
-def rm_child(folder_id, file_id):
+def rm_child(folder_id, file_id, ancestor_ids, pipe=None):
     """
     Delete a file_id from folder:children, that file is a child of the folder.
     We also need to remove the file from cache to reclaim memory.
-    """
-    r.srem('{}:children'.format(folder_id), file_id)
-    bubble_delete(file_id, root_id=get_root_id())  # invalidate cache as size may change
+    :param ancestor_ids: ids of the file and all of its ancestors (see bubble_delete).
+    """
+    own_pipe = pipe is None  # See add_child
+    if own_pipe:
+        pipe = r.pipeline()
+    pipe.srem('{}:children'.format(folder_id), file_id)
+    bubble_delete(ancestor_ids, pipe=pipe)  # invalidate cache as size may change
+    if own_pipe:
+        pipe.execute()
     # here we can also delete files down the file system tree from the file being deleted
 
 
-def bubble_delete(file_id, root_id):
+def rm_children(files, ancestor_ids, pipe=None):
+    """
+    Delete many files from their folders (see rm_child), the files do not need to share a folder.
+    :param ancestor_ids: ids of the files and all of their ancestors, which are invalidated with one command.
+    """
+    own_pipe = pipe is None  # See add_child
+    if own_pipe:
+        pipe = r.pipeline()
+    for file in files:
+        pipe.srem('{}:children'.format(file.parent_id), file.id)
+    bubble_delete(ancestor_ids, pipe=pipe)  # invalidate cache as size may change
+    if own_pipe:
+        pipe.execute()
+
+
+def bubble_delete(file_ids, pipe=None):
     """
-    Delete file's parent, grandparent, grand grandparent, ..., root (bottom up).
+    Delete file, its parent, grandparent, grand grandparent, ..., root (bottom up) with one command.
     "File" refers both to normal files and folders.
+    The ids are given by the caller (see File.ancestor_ids), because intermediate folders are not necessarily cached,
+    so the cache alone can not tell which folders are above a file.
     """
-    if file_id == root_id:
-        r.delete('{}:data'.format(root_id))
-        return
-    file = get_data(file_id=file_id)
-    if file:  # if file is None, it means that all folders "above" were deleted
-        parent_id = file.get('parent_id')
-        r.delete('{}:data'.format(file_id))
-        bubble_delete(file_id=parent_id, root_id=root_id)
+    if file_ids:
+        (pipe or r).delete(*['{}:data'.format(file_id) for file_id in file_ids])
@@ -1,24 +1,41 @@
-from django.core.exceptions import ValidationError
-from django.db import DataError
+from django.conf import settings
+from django.core.exceptions import ValidationError, ImproperlyConfigured
+from django.db import DataError, OperationalError
 from django.test import TestCase
+from psycopg2 import errors
 
 from . import repositories as repo, services as cache
-from .exceptions import FileNotFound, FileExisted, InvalidFilename, MovedIntoSubFolder
+from .exceptions import FileNotFound, FileExisted, InvalidFilename, MovedIntoSubFolder, ConcurrentUpdate
 from .models import FilePath, File
 
 
 class BaseTestCase(TestCase):
     databases = '__all__'
 
+    @classmethod
+    def setUpClass(cls) -> None:
+        # Tests flush the cache, so they switch to their own database, whatever runs them
+        if settings.REDIS_TEST_DB == settings.REDIS_DB:
+            raise ImproperlyConfigured('REDIS_TEST_DB must differ from REDIS_DB, as tests flush it.')
+        cls._app_cache = cache.r
+        cache.r = cache.connect(settings.REDIS_TEST_DB)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        super().tearDownClass()
+        cache.r = cls._app_cache
+
     def setUp(self) -> None:
-        cache.r.flushall()
+        # Only the database of the cache is flushed, which is a separate one for tests (see setUpClass)
+        cache.r.flushdb(asynchronous=True)
         self._setUp()
 
     def _setUp(self) -> None:
         raise NotImplementedError
 
     def tearDown(self) -> None:
-        cache.r.flushall()
+        cache.r.flushdb(asynchronous=True)
 
 
 class FilePathTestCase(BaseTestCase):
@@ -47,6 +64,9 @@ class FilePathTestCase(BaseTestCase):
             '$hello',
             '\\',
             '/a/^/b',
+            'a/b',
+            '/caf\u00e9',
+            '/a\n',
         ]
         for path in invalid_paths:
             try:
@@ -61,9 +81,12 @@ class FilePathTestCase(BaseTestCase):
             ('/a/b/c/', '/a/b'),
             ('//', '/'),
             ('/', '/'),
+            ('//a/b', '/a'),
         ]
         for filepath in filepaths:
             self.assertEqual(FilePath(filepath[0]).parent().path, filepath[1])
+        filepath = FilePath('/a/b')
+        self.assertIs(filepath.parent(), filepath.parent())
 
     def test_get_dirs(self):
         filepaths = [
@@ -74,6 +97,14 @@ class FilePathTestCase(BaseTestCase):
         ]
         for filepath in filepaths:
             self.assertEqual(FilePath(filepath[0]).dirs(), filepath[1])
+            # Parent of a filepath, whose filenames are already extracted
+            path = FilePath(filepath[0])
+            path.dirs()
+            self.assertEqual(path.parent().dirs(), filepath[1][:-1])
+
+    def test_get_lineage(self):
+        self.assertEqual(FilePath('/a/b/c/').lineage(), ['/', '/a', '/a/b', '/a/b/c'])
+        self.assertEqual(FilePath('/').lineage(), ['/'])
 
 
 class FileModelTestCase(BaseTestCase):
@@ -109,6 +140,8 @@ class FileModelTestCase(BaseTestCase):
             'abc/',
             '',
             'a' * 256,
+            'a\n',
+            'caf\u00e9',
         ]
         for name in invalid_names:
             try:
@@ -135,6 +168,63 @@ class FileModelTestCase(BaseTestCase):
         except FileNotFound:
             self.fail('should delete successfully')
 
+    def test_get_children_without_data(self):
+        self.root.add_child(File(name='test 1', is_folder=False, data='hello'))
+        self.root.add_child(File(name='test 2', is_folder=False, data='hello world'))
+        cache.r.flushdb()
+        children = self.root.get_children()
+        with self.assertNumQueries(0):
+            self.assertEqual(sorted(child.size for child in children), [5, 11])
+        # Data is still loaded on access
+        self.assertEqual(sorted(child.data for child in self.root.get_children()), ['hello', 'hello world'])
+
+    def test_get_children_missing_in_cache(self):
+        files = [File(name='test {}'.format(i), is_folder=False, data='hello') for i in range(3)]
+        for file in files:
+            self.root.add_child(file)
+        cache.r.delete(*['{}:data'.format(file.id) for file in files])
+        with self.assertNumQueries(1):
+            children = self.root.get_children()
+        self.assertEqual(sorted(child.id for child in children), [file.id for file in files])
+
+    def test_get_size_of_file_without_data(self):
+        file = File(name='test 1', is_folder=False, data='hello')
+        self.root.add_child(file)
+        cache.r.flushdb()
+        file = File.objects.get(id=file.id)  # data is not loaded
+        with self.assertNumQueries(1):
+            self.assertEqual(file.size, 5)
+        with self.assertNumQueries(1):
+            self.assertEqual(file.data, 'hello')
+
+    def test_file_to_tuple_and_back(self):
+        file = File(name='test 1', is_folder=False, data='hello')
+        self.root.add_child(file)
+        cached_file = File.from_tuple(file.to_tuple())
+        self.assertEqual(cached_file, file)
+        self.assertEqual(cached_file.to_tuple(), file.to_tuple())
+        self.assertFalse(cached_file._state.adding)
+        # Through cache
+        self.assertEqual(File.from_tuple(cache.get_data(file.id)).to_tuple(), file.to_tuple())
+
+    def test_get_children_of_empty_folder(self):
+        folder = File(name='test 1', is_folder=True)
+        self.root.add_child(folder)
+        self.assertEqual(folder.get_children(), [])
+        # The folder is known to be empty from now on
+        with self.assertNumQueries(0):
+            self.assertEqual(folder.get_children(), [])
+        file = File(name='test 2', is_folder=False, data='hello')
+        folder.add_child(file)
+        self.assertEqual(folder.get_children(), [file])
+
+    def test_get_child_by_name(self):
+        file = File(name='test 1', is_folder=False, data='hello world')
+        self.root.add_child(file)
+        self.assertEqual(self.root.get_child('test 1').id, file.id)
+        self.root.remove_child(filename='test 1')
+        self.assertRaises(FileNotFound, self.root.get_child, 'test 1')
+
     def test_timestamp_created_correctly(self):
         self.assertTrue(self.root.created_at is not None)
 
@@ -171,6 +261,16 @@ class FileModelTestCase(BaseTestCase):
         self.assertEqual(self.root.size, 11)
         self.assertEqual(file1.size, 3)
         self.assertEqual(folder1.size, 7)
+        # Cached sizes of all ancestors are invalidated, even if the folders in between are not cached
+        folder1.add_child(File(name='test 7', is_folder=False, data='1234'))
+        self.assertEqual(self.root.size, 15)
+        # Moving a folder changes sizes of the destination as well
+        self.assertEqual(folder2.size, 1)
+        folder2.add_child(folder1)
+        self.assertEqual(folder2.size, 12)
+        # Adding a new folder looks up no ancestors, it is only inserted (within a savepoint) and the parent is touched
+        with self.assertNumQueries(4):
+            folder2.add_child(File(name='test 8', is_folder=True))
 
 
 class FileRepositoryTestCase(BaseTestCase):
@@ -187,6 +287,24 @@ class FileRepositoryTestCase(BaseTestCase):
         folder4 = File(name=' ', is_folder=True)
         root.add_child(folder4)
 
+    def test_concurrent_update_then_fail(self):
+        @repo._fail_on_concurrent_update
+        def update(error):
+            raise OperationalError from error
+
+        self.assertRaises(ConcurrentUpdate, update, errors.SerializationFailure())
+        self.assertRaises(ConcurrentUpdate, update, errors.DeadlockDetected())
+        self.assertRaises(OperationalError, update, errors.QueryCanceled())
+
+    def test_get_root_directory(self):
+        root = repo._get_root_directory()
+        cache.r.flushdb()
+        # An existing root directory is read within one query, then from cache
+        with self.assertNumQueries(1):
+            self.assertEqual(repo._get_root_directory().id, root.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(repo._get_root_directory().id, root.id)
+
     def test_get_file_then_success(self):
         try:
             filepaths = [
@@ -209,6 +327,7 @@ class FileRepositoryTestCase(BaseTestCase):
         filepaths = [
             '/f1/f2/ /./../../f1/ /test-1',
             '/f1/test-1',
+            '/f1/f2/ /test-1/f3',
         ]
         for filepath in filepaths:
             try:
@@ -239,6 +358,7 @@ class FileRepositoryTestCase(BaseTestCase):
         files = [
             ('/f1/f2/ /f3/$#/f', False, None),
             ('/f1/f2/ /test-1', True, 'test'),
+            ('/f1/f2/ /test-1/f4/test', True, 'test'),
         ]
         for (filepath, p_flag, data) in files:
             try:
@@ -260,6 +380,8 @@ class FileRepositoryTestCase(BaseTestCase):
         self.assertEqual(repo._get_root_directory().size, 1)
 
         repo.update_file(FilePath('/f1/f2/'), 'f3')
+        self.assertRaises(FileNotFound, repo.get_file(FilePath('/f1/')).get_child, 'f2')
+        self.assertEqual(repo.get_file(FilePath('/f1/')).get_child('f3').name, 'f3')
         repo.update_file(FilePath('/f1/f3/'), 'f4', 'test')
         _ = repo.get_file(FilePath('/f1/f4/ /test-2'))
 
@@ -268,6 +390,7 @@ class FileRepositoryTestCase(BaseTestCase):
             ('/f1/f3/ /test-1', 'a', None),
             ('/f1/f2/ /test-1', 'a#', None),
             ('/f1/f2/ /test-1', 'a#', 'test'),
+            ('/f1', ' ', None),
         ]
         for (filepath, name, data) in files:
             try:
@@ -290,6 +413,9 @@ class FileRepositoryTestCase(BaseTestCase):
             self.fail('should fail when delete file ')
         except (FileNotFound, FileExisted):
             pass
+        # Nothing is deleted when any filepath fails
+        _ = repo.get_file(FilePath('/f1/f2/ /test-1'))
+        self.assertRaises(FileNotFound, repo.remove_file, [FilePath('/')])
 
     def test_move_file_then_success(self):
         repo.move_file(FilePath('/f1/f2/ /test-1'), FilePath('/f1/f2/'))
@@ -314,6 +440,9 @@ class FileRepositoryTestCase(BaseTestCase):
                 self.fail('should fail when get file ')
             except (FileNotFound, FileExisted, MovedIntoSubFolder):
                 pass
+        # Moving a file into its own folder changes nothing
+        self.assertRaises(FileExisted, repo.move_file, FilePath('/f1/f2/ /test-1'), FilePath('/f1/f2/ /'))
+        self.assertEqual([child.name for child in repo.get_file(FilePath('/f1/f2/ /')).get_children()], ['test-1'])
 
     def test_find_then_success(self):
         file_tree = [